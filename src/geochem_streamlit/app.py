@@ -1,30 +1,26 @@
-import copy
-import json
-import random
 from typing import Any
 from typing import Dict
 
+import orjson
 import pandas as pd
 import streamlit as st
 
-from geochem_streamlit import normalizer
 from geochem_streamlit.binning import binning_widget
 from geochem_streamlit.data_loader import get_dataframe
 from geochem_streamlit.editors import inherit_styles_from_typeloc
 from geochem_streamlit.export_manager import render_export_buttons
 from geochem_streamlit.export_manager import render_export_settings
 from geochem_streamlit.filter_bar import filter_dataframe
-from geochem_streamlit.plotting import plot_box_plot
-from geochem_streamlit.plotting import plot_demo_table
-from geochem_streamlit.plotting import plot_user_table
 from geochem_streamlit.sidebar_info import show_sidebar_info
 from geochem_streamlit.styles import AVAILABLE_SYMBOLS
-from geochem_streamlit.styles import build_style_maps
+from geochem_streamlit.styles import SYMBOL_IDX
+from geochem_streamlit.styles import session_style_maps
+from geochem_streamlit.styles import line_style_defaults
 from geochem_streamlit.styles import line_style_editor
-from geochem_streamlit.tas_plot import show_tas
 from geochem_streamlit.user_style import generate_group_styles
 from geochem_streamlit.user_style import group_style_editor
 from geochem_streamlit.utils import axis_selector
+from geochem_streamlit.utils import combine_labels
 
 
 def main():
@@ -37,8 +33,10 @@ def main():
     columns = list(df.columns)
 
     if {"type", "Location"}.issubset(df.columns):
-        df["type_loc"] = df["type"].astype(str) + "|" + df["Location"].astype(str)
-        base_color, base_symbol, base_size = build_style_maps(
+        df["type_loc"] = combine_labels(df["type"], df["Location"])
+        # карты из session_state, пересчёт только при смене type/Location;
+        # base_* только читаются, правки идут в копии *_map_user ниже
+        base_color, base_symbol, base_size = session_style_maps(
             df, type_col="type", loc_col="Location"
         )
     else:
@@ -109,7 +107,11 @@ def main():
     #   MULTIELEMENTAL  PLOT
     # --------------------------------------------------------------
 
+    # Модули построения графиков импортируются в своей ветке: при холодном
+    # старте сессии грузится только то, что нужно выбранному типу графика
     if plot_type == "Multielemental plot":
+        from geochem_streamlit import normalizer
+
         fig = None
         group_col: str | None = None
         elems: list[str] = []
@@ -134,12 +136,14 @@ def main():
                 color_map, symbol_map, size_map = build_group_style(
                     df_plot, group_col, base_color, base_symbol, base_size
                 )
-                opacity_map = {g: 0.9 for g in color_map}
-                width_map = {g: 2 for g in color_map}
-                dash_map = {g: "solid" for g in color_map}
-                line_color_map = {g: color_map[g] for g in color_map}  # стартуем тем же
-                outline_color_map = {g: "#000000" for g in color_map}  # черный контур
-                outline_width_map = {g: 0 for g in color_map}
+                (
+                    opacity_map,
+                    width_map,
+                    dash_map,
+                    line_color_map,  # стартуем тем же цветом, что и маркеры
+                    outline_color_map,  # черный контур
+                    outline_width_map,
+                ) = line_style_defaults(color_map)
 
                 st.sidebar.markdown(f"---\n### Line & Marker style ({group_col})")
                 (
@@ -193,6 +197,8 @@ def main():
         st.stop()
 
     if plot_type == "TAS diagram":
+        from geochem_streamlit.tas_plot import show_tas
+
         fig, plot_df_tas = show_tas(
             df=df,
             user_data=user_data,
@@ -244,9 +250,13 @@ def main():
     nested_bin_col = None  # конечная комбинированная колонка
     second_num_col = None  # числовая переменная для бинов
 
-    if group_col and not pd.api.types.is_numeric_dtype(df[group_col]):
+    # числовые столбцы — один проход по df.dtypes, без Series на каждый столбец
+    is_numeric = df.dtypes.map(pd.api.types.is_numeric_dtype)
+    group_is_numeric = bool(group_col) and bool(is_numeric[group_col])
+
+    if group_col and not group_is_numeric:
         # есть ли вообще числовые столбцы?
-        numeric_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+        numeric_cols = is_numeric.index[is_numeric].tolist()
         if numeric_cols:
             second_num_col = st.sidebar.selectbox(
                 "Sub-bin by numeric …", [""] + numeric_cols, index=0
@@ -257,16 +267,14 @@ def main():
                 sub_bin_col, _ = binning_widget(df, second_num_col)
 
                 if sub_bin_col:
-                    combined = (
-                        df[group_col].astype(str) + "|" + df[sub_bin_col].astype(str)
-                    )
+                    combined = combine_labels(df[group_col], df[sub_bin_col])
                     nested_bin_col = "__combined_group"
                     df[nested_bin_col] = combined
 
     if nested_bin_col:  # вариант «категория + бины»
         group_for_plot = nested_bin_col
 
-    elif group_col and pd.api.types.is_numeric_dtype(df[group_col]):
+    elif group_is_numeric:
         # старая логика «числовая группировка → глобальный бининг»
         global_bin_col, _ = binning_widget(df, group_col)
         group_for_plot = global_bin_col if global_bin_col else None
@@ -280,7 +288,10 @@ def main():
 
     df = filter_dataframe(df)
 
-    plot_df = df.copy()
+    # только колонки, которые читают графики (оси, группа, подсказки):
+    # копия ограничена числом этих колонок, а не всей таблицей
+    needed = {x_axis, y_axis, group_for_plot or "type_loc", *hover_cols}
+    plot_df = df[[c for c in df.columns if c in needed]]
     bg_color = "#ffffff"
     font_color = "#000000"
 
@@ -290,7 +301,7 @@ def main():
         color_map_user, symbol_map_user, size_map_user = build_group_style(
             df, group_for_plot, base_color, base_symbol, base_size
         )
-        opacity_map_user = {g: 0.9 for g in color_map_user}
+        opacity_map_user = dict.fromkeys(color_map_user, 0.9)
 
         st.sidebar.markdown(f"---\n### Color & Trace style ({group_for_plot})")
         color_map_user, symbol_map_user, size_map_user, opacity_map_user = (
@@ -318,48 +329,51 @@ def main():
     if not user_data:
         st.sidebar.markdown("---\n### Color & Trace style (type | Location)")
 
-        pre_symbols = AVAILABLE_SYMBOLS.copy()
-        random.seed(42)
-        for key in sorted(df["type_loc"].dropna().unique()):
-            typ = key.split("|")[0]
-            with st.sidebar.expander(key, expanded=False):
-                cur_color = color_map_user.get(key, "#1f77b4")
-                cur_symbol = symbol_map_user.get(typ, "circle")
-                cur_size = size_map_user.get(typ, 20)
-                color = st.color_picker("Color", cur_color, key=f"demo_col_{key}")
-                sym_idx = (
-                    pre_symbols.index(cur_symbol) if cur_symbol in pre_symbols else 0
-                )
-                symbol = st.selectbox(
-                    "Symbol", pre_symbols, index=sym_idx, key=f"demo_sym_{key}"
-                )
-                size = st.slider("Size (px)", 2, 80, cur_size, key=f"demo_sz_{key}")
-                alpha = (
-                    st.slider("Opacity (%)", 10, 100, 90, key=f"demo_op_{key}") / 100
-                )
-                outcol = st.color_picker("Outline", "#000000", key=f"demo_out_{key}")
-                outwid = st.slider(
-                    "Outline width", 1.0, 6.0, 1.0, 0.5, key=f"demo_ow_{key}"
-                )
+        pre_symbols = AVAILABLE_SYMBOLS  # только читается selectbox'ом
+        # форма: пересборка графика только по кнопке «Apply»
+        with st.sidebar.form(key="demo_style_form"):
+            for key in sorted(df["type_loc"].dropna().unique()):
+                typ = key.split("|")[0]
+                with st.expander(key, expanded=False):
+                    cur_color = color_map_user.get(key, "#1f77b4")
+                    cur_symbol = symbol_map_user.get(typ, "circle")
+                    cur_size = size_map_user.get(typ, 20)
+                    color = st.color_picker("Color", cur_color, key=f"demo_col_{key}")
+                    sym_idx = SYMBOL_IDX.get(cur_symbol, 0)
+                    symbol = st.selectbox(
+                        "Symbol", pre_symbols, index=sym_idx, key=f"demo_sym_{key}"
+                    )
+                    size = st.slider("Size (px)", 2, 80, cur_size, key=f"demo_sz_{key}")
+                    alpha = (
+                        st.slider("Opacity (%)", 10, 100, 90, key=f"demo_op_{key}")
+                        / 100
+                    )
+                    outcol = st.color_picker(
+                        "Outline", "#000000", key=f"demo_out_{key}"
+                    )
+                    outwid = st.slider(
+                        "Outline width", 1.0, 6.0, 1.0, 0.5, key=f"demo_ow_{key}"
+                    )
 
-                color_map_user[key] = color
-                symbol_map_user[typ] = symbol
-                size_map_user[typ] = size
-                styles[key] = {
-                    "color": color,
-                    "symbol": symbol,
-                    "size": size,
-                    "opacity": alpha,
-                    "outline_color": outcol,
-                    "outline_width": outwid,
-                }
+                    color_map_user[key] = color
+                    symbol_map_user[typ] = symbol
+                    size_map_user[typ] = size
+                    styles[key] = {
+                        "color": color,
+                        "symbol": symbol,
+                        "size": size,
+                        "opacity": alpha,
+                        "outline_color": outcol,
+                        "outline_width": outwid,
+                    }
+            st.form_submit_button("Apply", use_container_width=True)
 
     opacity_map_user = {}  # <- чтобы был всегда, даже если не user_data
 
     # ─── download data ─────────────────────────────────────────────
     if uploaded_style is not None:
         try:
-            styles = json.load(uploaded_style)  # file-object -> dict
+            styles = orjson.loads(uploaded_style.getvalue())  # bytes -> dict
 
             # --- ⬇︎ PARSE AND APPLY STYLES ------------------
             for key, attrs in styles.items():
@@ -384,7 +398,10 @@ def main():
             st.error(f"Failed to load style: {e}")
 
     # ─── SAVE BUTTON ─────────────────────────────────────────
-    json_bytes = json.dumps(styles, indent=2).encode("utf-8")
+    # orjson сразу отдаёт bytes (без промежуточной str и encode)
+    json_bytes = orjson.dumps(
+        styles, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+    )
     st.sidebar.download_button(
         "💾 Save style (JSON)",
         data=json_bytes,
@@ -393,6 +410,10 @@ def main():
         use_container_width=True,
     )
 
+    from geochem_streamlit.plotting import plot_box_plot
+    from geochem_streamlit.plotting import plot_demo_table
+    from geochem_streamlit.plotting import plot_user_table
+
     if plot_type == "Scatter plot":
         if not user_data:
             fig = plot_demo_table(
@@ -456,11 +477,8 @@ def main():
 
     st.plotly_chart(fig, use_container_width=True)
 
-    # ─── DOWNLOADS ─────────────────────────────────────────────────────
-    export_fig = copy.deepcopy(fig)
-    export_fig.update_layout(
-        width=1200, height=800, margin=dict(l=80, r=120, t=60, b=60), showlegend=False
-    )
+    # Размеры/поля для файлов экспорта задаёт ExportManager (DEFAULT_LAYOUT)
+    # на копии-словаре при сохранении, глубокая копия fig здесь не нужна
 
     # ─── UNIVERSAL EXPORT SECTION ─────────────────────────────────────────
     # Эта секция будет работать для всех типов графиков
@@ -0,0 +1,22 @@
+# Общий стиль осей для диаграмм рассеяния, спайдер- и TAS-диаграмм
+AXIS_STYLE = dict(
+    linecolor="#000000",
+    mirror=True,
+    showline=True,
+    ticks="inside",
+    ticklen=6,
+    tickwidth=1,
+    tickcolor="#000000",
+    gridcolor="rgba(0,0,0,0.15)",
+    minor=dict(showgrid=True, gridwidth=0.5, gridcolor="rgba(0,0,0,0.05)"),
+    tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
+)
+
+
+def axis_layout(title, **extra):
+    """Словарь оси: общий стиль + подпись (для layout.xaxis / layout.yaxis)."""
+    return {
+        **AXIS_STYLE,
+        "title": dict(text=title, font=dict(size=18, color="#111111")),
+        **extra,
+    }
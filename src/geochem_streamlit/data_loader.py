@@ -1,10 +1,46 @@
+import io
+
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+_INT32 = np.iinfo(np.int32)
+
+
+def _downcast_ints(df: pd.DataFrame) -> pd.DataFrame:
+    # Целые столбцы int64 переводятся в int32, если значения помещаются;
+    # меньше не ужимаем — суммы оксидов и отношения в int8/int16 переполнились
+    # бы без ошибки. float64 не трогаем — float32 исказил бы концентрации
+    for c in df.select_dtypes("int64").columns:
+        col = df[c]
+        if col.empty or (_INT32.min <= col.min() and col.max() <= _INT32.max):
+            df[c] = col.astype(np.int32)
+    return df
+
 
 @st.cache_data(ttl=3600)
 def load_csv(url: str) -> pd.DataFrame:
-    return pd.read_csv(url)
+    return _downcast_ints(pd.read_csv(url))
+
+
+# Таблица пользователя может меняться: короткий ttl плюс кнопка «Reload sheet»
+# вместо часового кэша демонстрационного CSV
+@st.cache_data(ttl=60, show_spinner=False, max_entries=8)
+def load_gsheet(csv_url: str) -> pd.DataFrame:
+    return _downcast_ints(pd.read_csv(csv_url))
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_uploaded(data: bytes, name: str) -> pd.DataFrame:
+    # ключ кэша — содержимое файла и имя, повторный разбор при rerun не нужен
+    buffer = io.BytesIO(data)
+    if name.endswith((".xls", ".xlsx")):
+        df = pd.read_excel(buffer)
+    elif name.endswith(".txt"):
+        df = pd.read_csv(buffer, sep="\t")
+    else:
+        df = pd.read_csv(buffer)
+    return _downcast_ints(df)
 
 
 def get_dataframe_from_gsheet(gs_url: str):
@@ -19,7 +55,9 @@ def get_dataframe_from_gsheet(gs_url: str):
         else:
             st.error("Incorrect link to Google Sheets!")
             return pd.DataFrame(), False
-        df = pd.read_csv(csv_url)
+        if st.sidebar.button("Reload sheet", key="gsheet_reload"):
+            load_gsheet.clear(csv_url)
+        df = load_gsheet(csv_url)
         st.success("Data from Google Sheets loaded successfully!")
         return df, True
     except Exception as e:
@@ -42,12 +80,7 @@ def get_dataframe():
 
     if uploaded_file is not None:
         try:
-            if uploaded_file.name.endswith((".xls", ".xlsx")):
-                df = pd.read_excel(uploaded_file)
-            elif uploaded_file.name.endswith(".txt"):
-                df = pd.read_csv(uploaded_file, sep="\t")
-            else:
-                df = pd.read_csv(uploaded_file)
+            df = load_uploaded(uploaded_file.getvalue(), uploaded_file.name)
             st.success("File uploaded successfully!")
             return df, True
         except Exception as e:
@@ -1,6 +1,6 @@
 from geochem_streamlit.styles import AVAILABLE_SYMBOLS  # если нужно
+from geochem_streamlit.styles import SYMBOL_IDX
 import streamlit as st
-import random
 import pandas as pd
 
 
@@ -17,7 +17,6 @@ def default_style_editor(
         styles = {}
 
     pre_symbols = AVAILABLE_SYMBOLS.copy()
-    random.seed(42)
 
     for key in sorted(df["type_loc"].dropna().unique()):
         # key = 'Amphibolite|Himalaya', например
@@ -27,7 +26,7 @@ def default_style_editor(
         cur_size = size_map_user.get(key, 20)
         with st.sidebar.expander(key, expanded=False):
             color = st.color_picker("Color", cur_color, key=f"col_{key}")
-            sym_idx = pre_symbols.index(cur_symbol) if cur_symbol in pre_symbols else 0
+            sym_idx = SYMBOL_IDX.get(cur_symbol, 0)
             symbol = st.selectbox(
                 "Symbol", pre_symbols, index=sym_idx, key=f"sym_{key}"
             )
@@ -58,14 +57,17 @@ def inherit_styles_from_typeloc(
     """Собирает color / symbol / size-карты для переменной group_col
     (например, «To plot») на основе уже существующих карт."""
     color_map, symbol_map, size_map = {}, {}, {}
-    unique_groups = df[group_col].dropna().unique()
 
-    for g in unique_groups:
-        # Берём первый непустой образец внутри этой группы
-        row = df.loc[df[group_col] == g].iloc[0]
+    # Первый образец каждой группы — один проход drop_duplicates вместо
+    # отдельной маски df[group_col] == g на каждую группу
+    cols = list(dict.fromkeys([group_col, "type", "Location"]))
+    firsts = df.loc[df[group_col].notna(), cols].drop_duplicates(subset=group_col)
 
-        typ = str(row["type"])
-        type_loc_key = f"{row['type']}|{row['Location']}"
+    for g, typ_val, loc_val in zip(
+        firsts[group_col].to_numpy(), firsts["type"], firsts["Location"]
+    ):
+        typ = str(typ_val)
+        type_loc_key = f"{typ_val}|{loc_val}"
 
         color_map[g] = base_color.get(type_loc_key, "#1f77b4")
         symbol_map[g] = base_symbol.get(typ, "circle")
@@ -17,7 +17,11 @@ PNG* contain every marker.
 
 from __future__ import annotations
 
+import functools
+import hashlib
 import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Tuple
 
@@ -27,6 +31,9 @@ import streamlit as st
 import plotly.io as pio
 
 pio.kaleido.scope.default_format = "png"
+# orjson is a declared dependency: serialise figures with it explicitly rather
+# than relying on "auto" detection (NumPy arrays are encoded without tolist()).
+pio.json.config.default_engine = "orjson"
 
 # ─── Logging ──────────────────────────────────────────────────────────────────
 logging.basicConfig(level=logging.INFO)
@@ -36,10 +43,12 @@ logger = logging.getLogger(__name__)
 # ─── Utility functions ────────────────────────────────────────────────────────
 
 
+@functools.lru_cache(maxsize=1)
 def _is_cloud_environment() -> bool:
-    """Detect Streamlit Cloud / Render / Heroku etc. for limited export modes."""
-    import os
+    """Detect Streamlit Cloud / Render / Heroku etc. for limited export modes.
 
+    The environment does not change while the app runs, so it is scanned once.
+    """
     cloud_indicators = {
         "STREAMLIT_SHARING",
         "STREAMLIT_CLOUD",
@@ -71,30 +80,57 @@ class ExportManager:
 
     # ── Private helpers ────────────────────────────────────────────────────
     @staticmethod
-    def _vectorise_traces(fig: go.Figure) -> go.Figure:
-        """Return a *copy* of *fig* with WebGL traces swapped to SVG ones."""
-        fig_dict = fig.to_plotly_json()
+    def _vectorise_traces(fig_dict: dict) -> dict:
+        """Swap WebGL traces in *fig_dict* to SVG ones (in place) and return it."""
         for trace in fig_dict.get("data", []):
             t_type: str = trace.get("type", "")
             if t_type.endswith("gl"):
                 trace["type"] = t_type[:-2]  # drop the trailing "gl"
-        return go.Figure(fig_dict)
+        return fig_dict
 
     @staticmethod
-    def _prepare(fig: go.Figure, cfg: Optional[dict] = None) -> go.Figure:
-        """Deep‑copy *fig* and merge in layout settings."""
-        new_fig = go.Figure(fig.to_plotly_json())
+    def _prepare(fig: go.Figure, cfg: Optional[dict] = None) -> dict:
+        """Return a plain-dict copy of *fig* with layout settings merged in.
+
+        Only the layout is rebuilt as a graph object (so that magic underscore
+        keys like ``font_family`` are expanded); traces stay plain dicts and are
+        never re-validated.
+        """
+        fig_dict = fig.to_plotly_json()
         layout_cfg = ExportManager.DEFAULT_LAYOUT.copy()
         if cfg:
             layout_cfg.update(cfg)
-        new_fig.update_layout(**layout_cfg)
-        return new_fig
+        layout = go.Layout(fig_dict.get("layout", {}))
+        layout.update(layout_cfg)
+        fig_dict["layout"] = layout.to_plotly_json()
+        return fig_dict
+
+    @staticmethod
+    def _to_image(fig_dict: dict, fmt: str) -> bytes:
+        """Render an already prepared figure dict to *fmt* with Kaleido."""
+        layout = fig_dict.get("layout", {})
+        return pio.to_image(
+            fig_dict,
+            format=fmt,
+            width=layout.get("width"),
+            height=layout.get("height"),
+            validate=False,
+        )
+
+    @staticmethod
+    def prepare_static(fig: go.Figure, cfg: Optional[dict] = None) -> dict:
+        """Prepare *fig* once for any number of PNG / SVG / PDF exports."""
+        return ExportManager._vectorise_traces(ExportManager._prepare(fig, cfg))
 
     # ── Public API ─────────────────────────────────────────────────────────
     @staticmethod
     def export_html(
-        fig: go.Figure, filename: Optional[str] = None, cfg: Optional[dict] = None
+        fig: go.Figure,
+        filename: Optional[str] = None,
+        cfg: Optional[dict] = None,
+        include_plotlyjs: str | bool = "inline",
     ) -> Tuple[str, str]:
+        """Export standalone HTML; pass ``include_plotlyjs="cdn"`` to skip ~3 MB."""
         try:
             fig_out = ExportManager._prepare(fig, cfg)
             if not filename:
@@ -102,8 +138,10 @@ class ExportManager:
             elif not filename.endswith(".html"):
                 filename += ".html"
 
-            html = fig_out.to_html(
-                include_plotlyjs="inline",
+            html = pio.to_html(
+                fig_out,
+                validate=False,
+                include_plotlyjs=include_plotlyjs,
                 config={
                     "displayModeBar": True,
                     "displaylogo": False,
@@ -120,60 +158,59 @@ class ExportManager:
         fig: go.Figure,
         filename: Optional[str] = None,
         cfg: Optional[dict] = None,
+        prepared: Optional[dict] = None,
     ) -> Tuple[bytes, str]:
-        """Export PNG **with all symbols intact** (no missing WebGL layers)."""
+        """Export PNG **with all symbols intact** (no missing WebGL layers).
+
+        *prepared* (from :meth:`prepare_static`) skips preparing *fig* again.
+        """
         try:
             # 🆕 Ensure WebGL traces are down‑converted before Kaleido snapshot
-            fig_out = ExportManager._vectorise_traces(ExportManager._prepare(fig, cfg))
+            fig_out = prepared or ExportManager.prepare_static(fig, cfg)
             if not filename:
                 filename = f"geoquick_plot_{datetime.now():%Y%m%d_%H%M%S}.png"
             elif not filename.endswith(".png"):
                 filename += ".png"
-            return fig_out.to_image(format="png", engine="kaleido"), filename
+            return ExportManager._to_image(fig_out, "png"), filename
         except Exception as exc:
             logger.error("PNG export failed: %s", exc)
             raise ExportError(str(exc)) from exc
 
     @staticmethod
     def export_svg(
-        fig: go.Figure, filename: Optional[str] = None, cfg: Optional[dict] = None
-    ) -> Tuple[str, str]:
+        fig: go.Figure,
+        filename: Optional[str] = None,
+        cfg: Optional[dict] = None,
+        prepared: Optional[dict] = None,
+    ) -> Tuple[bytes, str]:
+        """Export SVG as raw bytes (no decode - avoids a second copy in memory)."""
         try:
-            fig_out = ExportManager._vectorise_traces(ExportManager._prepare(fig, cfg))
+            fig_out = prepared or ExportManager.prepare_static(fig, cfg)
             if not filename:
                 filename = f"geoquick_plot_{datetime.now():%Y%m%d_%H%M%S}.svg"
             elif not filename.endswith(".svg"):
                 filename += ".svg"
 
-            svg_bytes = fig_out.to_image(format="svg", engine="kaleido")
-            svg_str = (
-                svg_bytes.decode("utf-8") if isinstance(svg_bytes, bytes) else svg_bytes
-            )
-            return svg_str, filename
+            return ExportManager._to_image(fig_out, "svg"), filename
         except Exception as exc:
             logger.error("SVG export failed: %s", exc)
             raise ExportError(str(exc)) from exc
 
     @staticmethod
     def export_pdf(
-        fig: go.Figure, filename: Optional[str] = None, cfg: Optional[dict] = None
+        fig: go.Figure,
+        filename: Optional[str] = None,
+        cfg: Optional[dict] = None,
+        prepared: Optional[dict] = None,
     ) -> Tuple[bytes, str]:
         try:
-            fig_out = ExportManager._vectorise_traces(ExportManager._prepare(fig, cfg))
+            fig_out = prepared or ExportManager.prepare_static(fig, cfg)
             if not filename:
                 filename = f"geoquick_plot_{datetime.now():%Y%m%d_%H%M%S}.pdf"
             elif not filename.endswith(".pdf"):
                 filename += ".pdf"
 
-            return (
-                fig_out.to_image(
-                    format="pdf",
-                    engine="kaleido",
-                    width=fig_out.layout.width,
-                    height=fig_out.layout.height,
-                ),
-                filename,
-            )
+            return ExportManager._to_image(fig_out, "pdf"), filename
         except Exception as exc:  # noqa: BLE001
             logger.error("PDF export failed: %s", exc)
             raise ExportError(str(exc)) from exc
@@ -181,6 +218,22 @@ class ExportManager:
 
 # ─── Streamlit helpers ───────────────────────────────────────────────────────
 
+# (format, button label, MIME type) for the static download buttons
+_STATIC_FORMATS = (
+    ("png", "🖼 PNG", "image/png"),
+    ("svg", "✒️ SVG", "image/svg+xml"),
+    ("pdf", "📄 PDF", "application/pdf"),
+)
+
+
+@st.cache_data(show_spinner=False, max_entries=24)
+def _render_static(fig_json: str, fmt: str, _prepared: dict) -> bytes:
+    """Render a prepared figure with Kaleido, cached on its JSON and format.
+
+    *_prepared* is the same figure as a dict (skipped by Streamlit's hashing).
+    """
+    return ExportManager._to_image(_prepared, fmt)
+
 
 def render_export_buttons(
     fig: go.Figure, export_cfg: Optional[dict] = None, key_prefix: str = "export"
@@ -190,8 +243,11 @@ def render_export_buttons(
     cloud = _is_cloud_environment()
 
     if cloud:
-        # On Streamlit Cloud we only guarantee HTML because Kaleido may be absent
-        html, fname = ExportManager.export_html(fig, cfg=export_cfg)
+        # On Streamlit Cloud we only guarantee HTML because Kaleido may be absent.
+        # A hosted app implies network access, so plotly.js is loaded from the CDN.
+        html, fname = ExportManager.export_html(
+            fig, cfg=export_cfg, include_plotlyjs="cdn"
+        )
         st.download_button(
             "💾 Save as HTML",
             html,
@@ -203,42 +259,50 @@ def render_export_buttons(
         st.info("PNG/SVG/PDF exports are disabled in this environment.")
         return
 
-    # Desktop / full Python runtime
-    col1, col2, col3 = st.columns(3)
-
+    # Desktop / full Python runtime.
+    # Kaleido renders are costly, so static files are built only when the user
+    # asks for them and are reused for as long as the prepared figure stays the
+    # same. The three formats are then rendered concurrently (the renders wait on
+    # the browser process); st.* calls stay on the script thread.
     try:
-        with col1:
-            png_bytes, fname = ExportManager.export_png(fig, cfg=export_cfg)
-            st.download_button(
-                "🖼 PNG",
-                png_bytes,
-                fname,
-                mime="image/png",
-                use_container_width=True,
-                key=f"{key_prefix}_png",
-            )
-        with col2:
-            svg_str, fname = ExportManager.export_svg(fig, cfg=export_cfg)
-            st.download_button(
-                "✒️ SVG",
-                svg_str,
-                fname,
-                mime="image/svg+xml",
-                use_container_width=True,
-                key=f"{key_prefix}_svg",
-            )
-        with col3:
-            pdf_bytes, fname = ExportManager.export_pdf(fig, cfg=export_cfg)
-            st.download_button(
-                "📄 PDF",
-                pdf_bytes,
-                fname,
-                mime="application/pdf",
+        # Layout merge + WebGL rewrite once; the renders only read the dict.
+        prepared = ExportManager.prepare_static(fig, export_cfg)
+        fig_json = pio.to_json(prepared, validate=False)
+        fingerprint = hashlib.blake2b(fig_json.encode(), digest_size=16).digest()
+
+        state_key = f"{key_prefix}_files"
+        stored = st.session_state.get(state_key)
+        if stored is None or stored[0] != fingerprint:
+            if not st.button(
+                "⚙️ Prepare PNG / SVG / PDF",
                 use_container_width=True,
-                key=f"{key_prefix}_pdf",
-            )
+                key=f"{key_prefix}_prepare",
+            ):
+                return
+            with st.spinner("Rendering export files…"):
+                with ThreadPoolExecutor(max_workers=len(_STATIC_FORMATS)) as pool:
+                    futures = {
+                        fmt: pool.submit(_render_static, fig_json, fmt, prepared)
+                        for fmt, _, _ in _STATIC_FORMATS
+                    }
+                files = {fmt: future.result() for fmt, future in futures.items()}
+            stamp = f"geoquick_plot_{datetime.now():%Y%m%d_%H%M%S}"
+            stored = (fingerprint, stamp, files)
+            st.session_state[state_key] = stored
+
+        _, stamp, files = stored
+        for col, (fmt, label, mime) in zip(st.columns(3), _STATIC_FORMATS):
+            with col:
+                st.download_button(
+                    label,
+                    files[fmt],
+                    f"{stamp}.{fmt}",
+                    mime=mime,
+                    use_container_width=True,
+                    key=f"{key_prefix}_{fmt}",
+                )
     except Exception:
-        logger.exception("Columns creation failed.")
+        logger.exception("Static export failed.")
 
 
 # ─── UI for export settings ─────────────────────────────────────────────────—
@@ -1,3 +1,4 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 
@@ -71,9 +72,10 @@ def filter_dataframe(df, plot_type=None):
             st.session_state.filters.pop(i)
             st.rerun()
 
-    # Фильтрация данных
+    # Фильтрация данных: без фильтров таблица возвращается как есть —
+    # вызывающий код лишь переназначает df и не меняет её на месте
     if not st.session_state.filters:
-        return df.copy()
+        return df
 
     # Создаем маски для каждого фильтра
     masks = []
@@ -122,6 +124,9 @@ def filter_dataframe(df, plot_type=None):
             for mask in masks[1:]:
                 final_mask = final_mask | mask
 
-        return df[final_mask].copy()
+        # take() gathers the selected rows in one pass per block; no extra copy.
+        # <NA> in a nullable boolean mask counts as False, as with df[mask]
+        rows = np.flatnonzero(final_mask.to_numpy(dtype=bool, na_value=False))
+        return df.take(rows, axis=0)
     else:
-        return df.copy()
+        return df
@@ -1,10 +1,13 @@
 # normalizer.py
 import json
 import re
+import numpy as np
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
 
+from geochem_streamlit.axis_style import axis_layout
+
 # ── пресеты (пример) ───────────────────────────────────────────
 CI_VALUES = {
     "La": 0.237,
@@ -191,6 +194,66 @@ CHEMICAL_ELEMENTS = {
     "Og",
 }
 
+# Элементы из словарей нормировки
+TARGET_ELEMENTS = frozenset(CI_VALUES) | frozenset(PM_VALUES)
+
+# ── скомпилированные регулярные выражения (один раз при импорте) ──
+# ТОЛЬКО очевидные паттерны: Ce_PPM, la-ppm, Nd_wt, PR-CONC, Ce_UG_G, Ce_mg_kg …
+_OBVIOUS_RE = re.compile(
+    r"^([A-Za-z]{1,2})(?:_(?:PPM|WT|CONC|CONTENT|UG_G|MG_KG)|-(?:PPM|WT|CONC))",
+    re.IGNORECASE,
+)
+# Разделители, которые убираются перед проверкой оксидов / служебных столбцов
+_CLEAN_RE = re.compile(r"[_\-\s]")
+# Заканчивается на O + цифры (K2O, TiO2, CaO) или содержит цифры + O (Al2O3)
+_OXIDE_RE = re.compile(r"O\d*$|\dO")
+
+# Список служебных названий (TOTAL, SUM, AVERAGE и т.д.)
+SERVICE_NAMES = frozenset(
+    {
+        "TOTAL",
+        "SUM",
+        "AVERAGE",
+        "AVG",
+        "MEAN",
+        "MEDIAN",
+        "COUNT",
+        "MIN",
+        "MAX",
+        "STD",
+        "VARIANCE",
+        "VAR",
+        "INDEX",
+        "ID",
+        "SAMPLE",
+        "NAME",
+        "NUMBER",
+        "NUM",
+        "DATE",
+        "TIME",
+        "LOCATION",
+        "LOC",
+        "DEPTH",
+        "LEVEL",
+    }
+)
+
+# Первые буквы служебных слов — дешёвый отсев до регулярного выражения
+_SERVICE_FIRST_CHARS = frozenset(name[0] for name in SERVICE_NAMES)
+
+# Начинается со служебного слова (длинные варианты первыми)
+_SERVICE_RE = re.compile(
+    r"^(?:"
+    + "|".join(map(re.escape, sorted(SERVICE_NAMES, key=len, reverse=True)))
+    + r")"
+)
+
+# Все правила отбраковки в одном выражении для очищенного имени:
+# сначала оксид (как и раньше), затем служебный префикс.
+_REJECT_RE = re.compile(
+    r"(?P<oxide>^(?=.*(?:O\d*$|\dO)))" + r"|(?P<service>" + _SERVICE_RE.pattern + ")"
+)
+
 
 def normalize_column_names(df: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, str]]:
     """
@@ -210,29 +273,45 @@ def normalize_column_names(df: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, st
         tuple: (новый DataFrame с переименованными столбцами, словарь маппинга старое_имя → новое_имя)
     """
 
-    mapping = {}
-    new_columns = []
+    # Маппинг зависит только от имён и типов столбцов, поэтому кэшируется по ним
+    numeric = df.dtypes.map(pd.api.types.is_numeric_dtype)
+    mapping = _compute_mapping(tuple(df.columns), tuple(numeric.tolist()))
 
-    for col in df.columns:
-        # Проверяем, является ли столбец числовым
-        if not pd.api.types.is_numeric_dtype(df[col]):
-            new_columns.append(col)  # Нечисловые столбцы оставляем как есть
-            continue
+    # Меняем только индекс столбцов, данные не копируются
+    df_normalized = df.rename(columns=mapping, copy=False)
 
-        # Ищем химический элемент в названии столбца
-        element = extract_element_from_column(col)
+    return df_normalized, mapping
 
-        if element:
-            mapping[col] = element
-            new_columns.append(element)
-        else:
-            new_columns.append(col)  # Если элемент не найден, оставляем как есть
 
-    # Создаем новый DataFrame с переименованными столбцами
-    df_normalized = df.copy()
-    df_normalized.columns = new_columns
+@st.cache_data(show_spinner=False)
+def _compute_mapping(
+    columns: tuple[str, ...], numeric: tuple[bool, ...]
+) -> dict[str, str]:
+    """
+    Строит маппинг старое_имя → элемент для числовых столбцов.
 
-    return df_normalized, mapping
+    Args:
+        columns: названия столбцов
+        numeric: флаги «столбец числовой» в том же порядке
+
+    Returns:
+        словарь маппинга старое_имя → новое_имя
+    """
+    # Все имена обрабатываются разом через .str (цикл на стороне pandas)
+    names = pd.Series(columns, dtype=object).astype(str)
+
+    # Оксиды и служебные столбцы не переименовываем
+    clean = names.str.replace(_CLEAN_RE, "", regex=True).str.upper()
+    rejected = clean.str.match(_REJECT_RE).to_numpy(dtype=bool)
+
+    # Ищем химический элемент в названии столбца
+    elements = names.str.extract(_OBVIOUS_RE, expand=False).str.capitalize()
+    found = elements.isin(TARGET_ELEMENTS).to_numpy(dtype=bool)
+
+    # Нечисловые столбцы оставляем как есть
+    keep = np.array(numeric, dtype=bool) & ~rejected & found
+    # Если элемент не найден, столбец остаётся как есть (его нет в маппинге)
+    return dict(zip(pd.Index(columns, dtype=object)[keep], elements[keep]))
 
 
 def extract_element_from_column(col_name: str) -> str | None:
@@ -247,49 +326,33 @@ def extract_element_from_column(col_name: str) -> str | None:
         символ элемента в правильном регистре или None, если не найден
     """
 
-    # Проверяем, не является ли это оксидом
-    if is_oxide_column(col_name):
-        return None
-
-    # Проверяем, не является ли это служебным столбцом
-    if is_service_column(col_name):
-        return None
-
-    # Элементы из ваших словарей нормировки
-    TARGET_ELEMENTS = set(CI_VALUES.keys()) | set(PM_VALUES.keys())
-
-    # ТОЛЬКО очевидные паттерны для переименования
-    obvious_patterns = [
-        r"^([A-Za-z]{1,2})_PPM",  # Ce_PPM, LA_PPM
-        r"^([A-Za-z]{1,2})_ppm",  # Ce_ppm, la_ppm
-        r"^([A-Za-z]{1,2})_WT",  # Ce_WT, la_wt
-        r"^([A-Za-z]{1,2})_wt",  # Ce_wt, la_wt
-        r"^([A-Za-z]{1,2})_CONC",  # Ce_CONC, la_conc
-        r"^([A-Za-z]{1,2})_conc",  # Ce_conc, la_conc
-        r"^([A-Za-z]{1,2})_CONTENT",  # Ce_CONTENT
-        r"^([A-Za-z]{1,2})_content",  # Ce_content
-        r"^([A-Za-z]{1,2})-PPM",  # Ce-PPM, LA-PPM
-        r"^([A-Za-z]{1,2})-ppm",  # Ce-ppm, la-ppm
-        r"^([A-Za-z]{1,2})-WT",  # Ce-WT, la-wt
-        r"^([A-Za-z]{1,2})-wt",  # Ce-wt, la-wt
-        r"^([A-Za-z]{1,2})-CONC",  # Ce-CONC, la-conc
-        r"^([A-Za-z]{1,2})-conc",  # Ce-conc, la-conc
-        r"^([A-Za-z]{1,2})_UG_G",  # Ce_UG_G (микрограмм на грамм)
-        r"^([A-Za-z]{1,2})_ug_g",  # Ce_ug_g
-        r"^([A-Za-z]{1,2})_MG_KG",  # Ce_MG_KG (миллиграмм на килограмм)
-        r"^([A-Za-z]{1,2})_mg_kg",  # Ce_mg_kg
-    ]
-
-    for pattern in obvious_patterns:
-        match = re.match(pattern, col_name, re.IGNORECASE)
-        if match:
-            element = match.group(1).capitalize()
-
-            # Проверяем, что это элемент из наших словарей нормировки
-            if element in TARGET_ELEMENTS:
-                return element
-
-    return None
+    return classify_column(col_name)[1]
+
+
+def classify_column(col_name: str) -> tuple[str | None, str | None]:
+    """
+    Классифицирует столбец одним проходом регулярных выражений.
+
+    Args:
+        col_name: название столбца
+
+    Returns:
+        (тег, элемент): тег — "oxide", "service", "element" или None;
+        элемент заполнен только для тега "element"
+    """
+    reject = _REJECT_RE.match(_CLEAN_RE.sub("", col_name).upper())
+    if reject:
+        return reject.lastgroup, None
+
+    match = _OBVIOUS_RE.match(col_name)
+    if match:
+        element = match.group(1).capitalize()
+
+        # Проверяем, что это элемент из наших словарей нормировки
+        if element in TARGET_ELEMENTS:
+            return "element", element
+
+    return None, None
 
 
 def show_column_mapping(mapping: dict[str, str]):
@@ -341,22 +404,14 @@ def is_oxide_column(col_name: str) -> bool:
     Returns:
         True, если это оксид
     """
-    # Убираем лишние символы и приводим к верхнему регистру
-    clean_name = re.sub(r"[_\-\s]", "", col_name).upper()
+    # Без буквы O оксидом быть не может — регулярка не нужна
+    if "O" not in col_name.upper():
+        return False
 
-    # Паттерны для оксидов
-    oxide_patterns = [
-        r"^[A-Z]+\d*O\d*$",  # K2O, TiO2, SiO2, Al2O3, Fe2O3
-        r"^[A-Z]+O\d*$",  # CaO, MgO, Na2O
-        r"O\d*$",  # Заканчивается на O + цифры
-        r"\d+O\d*",  # Содержит цифры + O + цифры
-    ]
-
-    for pattern in oxide_patterns:
-        if re.search(pattern, clean_name):
-            return True
+    # Убираем лишние символы и приводим к верхнему регистру
+    clean_name = _CLEAN_RE.sub("", col_name).upper()
 
-    return False
+    return _OXIDE_RE.search(clean_name) is not None
 
 
 def is_service_column(col_name: str) -> bool:
@@ -370,46 +425,18 @@ def is_service_column(col_name: str) -> bool:
         True, если это служебный столбец
     """
     # Убираем лишние символы и приводим к верхнему регистру
-    clean_name = re.sub(r"[_\-\s]", "", col_name).upper()
-
-    # Список служебных названий
-    service_names = {
-        "TOTAL",
-        "SUM",
-        "AVERAGE",
-        "AVG",
-        "MEAN",
-        "MEDIAN",
-        "COUNT",
-        "MIN",
-        "MAX",
-        "STD",
-        "VARIANCE",
-        "VAR",
-        "INDEX",
-        "ID",
-        "SAMPLE",
-        "NAME",
-        "NUMBER",
-        "NUM",
-        "DATE",
-        "TIME",
-        "LOCATION",
-        "LOC",
-        "DEPTH",
-        "LEVEL",
-    }
+    clean_name = _CLEAN_RE.sub("", col_name).upper()
 
     # Проверяем точное совпадение
-    if clean_name in service_names:
+    if clean_name in SERVICE_NAMES:
         return True
 
-    # Проверяем, начинается ли с служебного слова
-    for service in service_names:
-        if clean_name.startswith(service):
-            return True
+    # Первая буква не совпадает ни с одним служебным словом
+    if clean_name[:1] not in _SERVICE_FIRST_CHARS:
+        return False
 
-    return False
+    # Проверяем, начинается ли с служебного слова
+    return _SERVICE_RE.match(clean_name) is not None
 
 
 # ── 1. UI-контроль: выбор элементов и нормировки ───────────────
@@ -421,15 +448,21 @@ def norm_controls(df: pd.DataFrame):
     if "elem_list" not in st.session_state:
         st.session_state.elem_list = [""]
 
-    elem_cols = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+    # один проход по df.dtypes, без создания Series на каждый столбец
+    dtypes = df.dtypes
+    elem_cols = dtypes.index[dtypes.map(pd.api.types.is_numeric_dtype)].tolist()
+
+    # варианты и их индексы строятся один раз на все строки
+    options = [""] + elem_cols
+    idx_map = {v: i for i, v in enumerate(options)}
 
     remove = []
     for i, val in enumerate(st.session_state.elem_list):
         cols = st.sidebar.columns([5, 1])
         choice = cols[0].selectbox(
             f"{i + 1}",
-            [""] + elem_cols,
-            index=([""] + elem_cols).index(val) if val in elem_cols else 0,
+            options,
+            index=idx_map.get(val, 0),
             key=f"elem_sel_{i}",
         )
         st.session_state.elem_list[i] = choice
@@ -467,6 +500,7 @@ def norm_controls(df: pd.DataFrame):
     return ordered_elems, norm_dict
 
 
+@st.cache_data(show_spinner=False, max_entries=32)
 def multielemental_plot(
     df: pd.DataFrame,
     elems: list[str],
@@ -484,41 +518,75 @@ def multielemental_plot(
     log_y: bool = True,
 ):
     # ── нормировка ─────────────────────────────────────────────
-    df_vals = df[elems].dropna()
-    normed = df_vals.apply(lambda c: c / norm_dict.get(c.name, 1), axis=0)
+    complete = df[elems].notna().all(axis=1)
+    df_vals = df.loc[complete, elems]
+    # один вектор обратных величин вместо lambda на каждый столбец:
+    # умножение дешевле деления
+    divisor = np.fromiter(
+        (norm_dict.get(e, 1.0) for e in elems), dtype=np.float64, count=len(elems)
+    )
+    normed = df_vals.to_numpy(dtype=np.float64) * np.reciprocal(divisor)
 
-    fig = go.Figure()
-    first_seen = set()
+    # коды групп в порядке появления (NaN — отдельная группа)
+    if group_col:
+        codes, groups = pd.factorize(df.loc[complete, group_col], use_na_sentinel=False)
+    else:
+        codes, groups = np.zeros(len(normed), dtype=np.intp), np.array(["All"])
+
+    # ── стили разрешаются один раз на группу ──────────────────
+    color_map = color_map or {}
+    line_color_map = line_color_map or {}
+    symbol_map = symbol_map or {}
+    size_map = size_map or {}
+    width_map = width_map or {}
+    dash_map = dash_map or {}
+    outline_color_map = outline_color_map or {}
+    outline_width_map = outline_width_map or {}
+
+    styles_by_grp = {}
+    for g in groups:
+        m_color = color_map.get(g, "#1f77b4")
+        styles_by_grp[g] = (
+            m_color,
+            line_color_map.get(g, m_color),
+            symbol_map.get(g, "circle"),
+            size_map.get(g, 6),
+            width_map.get(g, 2),
+            dash_map.get(g, "solid"),
+            outline_color_map.get(g, "#000000"),
+            outline_width_map.get(g, 0),
+        )
 
-    for idx, row in normed.iterrows():
-        grp = df.loc[idx, group_col] if group_col else "All"
+    traces = []
 
-        show_flag = grp not in first_seen  # ← запомнили флаг
+    # одна трасса на группу: образцы разделены разрывом (None / NaN),
+    # поэтому Plotly рисует их отдельными ломаными
+    for code, grp in enumerate(groups):
+        sub = normed[codes == code]
+        xs = (list(elems) + [None]) * len(sub)
+        ys = np.column_stack([sub, np.full(len(sub), np.nan)]).ravel()
 
         # ── стили текущей группы ───────────────────────────────
-        m_color = color_map.get(grp, "#1f77b4") if color_map else "#1f77b4"
-        l_color = line_color_map.get(grp, m_color) if line_color_map else m_color
-
-        marker_sym = symbol_map.get(grp, "circle") if symbol_map else "circle"
-        marker_sz = size_map.get(grp, 6) if size_map else 6
-
-        line_wid = width_map.get(grp, 2) if width_map else 2
-        line_dash = dash_map.get(grp, "solid") if dash_map else "solid"
-
-        out_color = (
-            outline_color_map.get(grp, "#000000") if outline_color_map else "#000000"
-        )
-        out_width = outline_width_map.get(grp, 0) if outline_width_map else 0
+        (
+            m_color,
+            l_color,
+            marker_sym,
+            marker_sz,
+            line_wid,
+            line_dash,
+            out_color,
+            out_width,
+        ) = styles_by_grp[grp]
 
         # ── добавляем линию+маркеры ────────────────────────────
-        fig.add_trace(
+        traces.append(
             go.Scatter(
-                x=elems,
-                y=row.values,
+                x=xs,
+                y=ys,
                 mode="lines+markers",
                 name=str(grp),
                 legendgroup=str(grp),
-                showlegend=show_flag,
+                showlegend=True,
                 line=dict(color=l_color, width=line_wid, dash=line_dash),
                 marker=dict(
                     color=m_color,
@@ -529,57 +597,25 @@ def multielemental_plot(
                 hovertemplate="<b>%{x}</b><br>Norm=%{y:.3g}<extra></extra>",
             )
         )
-        if show_flag:
-            first_seen.add(grp)
-
-    fig.update_xaxes(
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-
-    fig.update_yaxes(
-        title_text="Value / Norm",
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
 
-    fig.update_layout(
-        xaxis=dict(title="Elements", type="category"),
-        yaxis=dict(title="Value / Norm", type="log" if log_y else "linear"),
-        hovermode="x unified",
-        paper_bgcolor="#ffffff",
-        plot_bgcolor="#ffffff",
-        height=650,
-        width=800,
-        showlegend=True,
-        legend_title=group_col if group_col else "",
-        legend=dict(  # ─── НОВОЕ ───
-            font=dict(size=14, color="#111111"),
-            bgcolor="rgba(255,255,255,0.8)",  # слегка прозрачный фон
-            bordercolor="#000000",
-            borderwidth=1,
+    fig = go.Figure(
+        data=traces,
+        layout=dict(
+            xaxis=axis_layout("Elements", type="category"),
+            yaxis=axis_layout("Value / Norm", type="log" if log_y else "linear"),
+            hovermode="x unified",
+            paper_bgcolor="#ffffff",
+            plot_bgcolor="#ffffff",
+            height=650,
+            width=800,
+            showlegend=True,
+            legend=dict(  # ─── НОВОЕ ───
+                title=dict(text=group_col if group_col else ""),
+                font=dict(size=14, color="#111111"),
+                bgcolor="rgba(255,255,255,0.8)",  # слегка прозрачный фон
+                bordercolor="#000000",
+                borderwidth=1,
+            ),
         ),
     )
     return fig
@@ -1,7 +1,53 @@
+import functools
+
+import numpy as np
+import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+from geochem_streamlit.axis_style import axis_layout
+
+# Стиль осей box-plot: шрифты подставляются под цвет текста графика
+_BOX_AXIS_STYLE = dict(
+    linecolor="#000",
+    mirror=True,
+    showline=True,
+    ticks="inside",
+    ticklen=6,
+    tickwidth=1,
+    tickcolor="#000",
+    gridcolor="rgba(0,0,0,0.12)",
+    minor=dict(showgrid=True, gridwidth=0.5, gridcolor="rgba(0,0,0,0.05)"),
+)
+
+
+def _per_group(codes, groups, mapping, default):
+    """Значение из *mapping* для каждой строки по кодам групп (pd.factorize).
+
+    Словарь опрашивается один раз на группу, строки получают значения
+    одним np.take, без промежуточной серии с NaN и fillna.
+    """
+    mapping = mapping or {}
+    values = np.array([mapping.get(g, default) for g in groups], dtype=float)
+    return np.take(values, codes)
+
+
+@functools.lru_cache(maxsize=64)
+def _hover_template(cols, extras_false):
+    """hover_data для набора колонок: cols → True, extras_false → False."""
+    template = {c: True for c in cols}
+    template.update({k: False for k in extras_false})
+    return template
 
+
+def _hover_dict(cols, extras_false=()):
+    """Копия закэшированного hover_data (px.scatter/px.box правят его на месте)."""
+    return dict(_hover_template(tuple(cols or ()), tuple(extras_false)))
+
+
+# Figures depend only on their arguments, so reruns triggered by unrelated widgets
+# reuse the cached figure. DataFrames are hashed by content (Streamlit default).
+@st.cache_data(show_spinner=False, max_entries=32)
 def plot_demo_table(
     df,
     x_axis,
@@ -17,23 +63,24 @@ def plot_demo_table(
     bg_color="#ffffff",
     font_color="#000000",
 ):
-    # 1) копия исходного DataFrame
-    plot_df = df.copy()
-
-    # 2) определяем колонку группировки
+    # 1) определяем колонку группировки
     grp = group_for_plot or "type_loc"
-    if grp not in plot_df.columns:
+    if grp not in df.columns:
         raise ValueError(f"Column '{grp}' not found in DataFrame")
 
-    # 3) выбрасываем строки без группового значения
-    plot_df = plot_df[plot_df[grp].notna()].copy()
+    # 2) выбрасываем строки без группового значения; отбор строк уже создаёт
+    #    новый DataFrame, поверхностная копия нужна лишь под служебный столбец
+    plot_df = df[df[grp].notna()].copy(deep=False)
 
     # ---------- далее идёт остальной код, который уже был ----------
     size_col = "__marker_size"
-    plot_df[size_col] = plot_df[grp].map(size_map_user).fillna(5)
+    grp_codes, grp_values = pd.factorize(plot_df[grp])
+    plot_df[size_col] = _per_group(grp_codes, grp_values, size_map_user, 5)
+
+    hover_dict = _hover_dict(hover_cols, (size_col,))
 
-    hover_dict = {c: True for c in hover_cols}
-    hover_dict[size_col] = False
+    # одна строковая копия группы на цвет и символ
+    grp_labels = plot_df[grp].astype(str)
 
     plot_args = dict(
         x=x_axis,
@@ -42,9 +89,9 @@ def plot_demo_table(
         log_x=log_x,
         log_y=log_y,
         height=650,
-        color=plot_df[grp].astype(str),
+        color=grp_labels,
         color_discrete_map=color_map_user,
-        symbol=plot_df[grp].astype(str),
+        symbol=grp_labels,
         symbol_map=symbol_map_user,
         size=plot_df[size_col],
         hover_name=grp,
@@ -64,65 +111,20 @@ def plot_demo_table(
             tr.marker.line.width = st_dict.get("outline_width", 1.0)
             tr.marker.opacity = st_dict.get("opacity", 0.9)
 
+    # оси и фон одним обновлением layout
     fig.update_layout(
-        xaxis_title=x_axis,
-        yaxis_title=y_axis,
+        xaxis=axis_layout(x_axis),
+        yaxis=axis_layout(y_axis),
         plot_bgcolor=bg_color,
         paper_bgcolor=bg_color,
         legend=dict(font=dict(color=font_color)),
         font=dict(color=font_color),
     )
 
-    axis_style = dict(
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-
-    fig.update_xaxes(
-        title_text=x_axis,
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-    fig.update_yaxes(
-        title_text=y_axis,
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-
     return fig
 
 
+@st.cache_data(show_spinner=False, max_entries=32)
 def plot_user_table(
     df,
     x_axis,
@@ -139,35 +141,30 @@ def plot_user_table(
     font_color="#000000",
     hover_cols=None,
 ):
-    plot_df = df.copy()
+    # Поверхностная копия: данные столбцов общие с df, добавляется только
+    # служебный столбец размера (прозрачность задаётся ниже по трэйсам)
+    plot_df = df.copy(deep=False)
 
-    # ВАЖНО: Сначала приводи к строке!
+    # ВАЖНО: Сначала приводи к строке! (замена столбца в копии, df не меняется)
     if group_for_plot and group_for_plot in plot_df.columns:
-        plot_df[group_for_plot] = plot_df[group_for_plot].astype(str)
-        color_series = plot_df[group_for_plot]
-        symbol_series = plot_df[group_for_plot]
+        plot_df[group_for_plot] = group_series = plot_df[group_for_plot].astype(str)
+        color_series = group_series
+        symbol_series = group_series
+        # коды групп считаются один раз; число групп берётся из них за O(1)
+        group_codes, group_values = pd.factorize(group_series)
         # Индивидуальный размер для каждой группы
         if size_map_user:
-            plot_df["__marker_size"] = (
-                plot_df[group_for_plot].map(size_map_user).fillna(20)
+            plot_df["__marker_size"] = _per_group(
+                group_codes, group_values, size_map_user, 20
             )
         else:
             plot_df["__marker_size"] = 20
-        # Индивидуальная прозрачность для каждой группы
-        if opacity_map_user:
-            plot_df["__marker_opacity"] = (
-                plot_df[group_for_plot].map(opacity_map_user).fillna(0.9)
-            )
-        else:
-            plot_df["__marker_opacity"] = 0.9
     else:
         color_series = None
         symbol_series = None
         plot_df["__marker_size"] = 15
-        plot_df["__marker_opacity"] = 0.9
 
-    hover_dict = {c: True for c in hover_cols}
-    hover_dict["__marker_size"] = False
+    hover_dict = _hover_dict(hover_cols, ("__marker_size",))
 
     plot_args = dict(
         x=x_axis,
@@ -186,14 +183,13 @@ def plot_user_table(
         if color_map_user:
             plot_args["color_discrete_map"] = color_map_user
         # Символы работают только для ограниченного числа групп (<15)
-        if plot_df[group_for_plot].nunique() < 30:
+        if len(group_values) < 30:
             plot_args["symbol"] = symbol_series
             if symbol_map_user:
                 plot_args["symbol_map"] = symbol_map_user
         plot_args["hover_name"] = group_for_plot
 
     fig = px.scatter(**plot_args)  # без size_max !
-    fig.update_traces(marker=dict(sizemode="diameter", sizeref=1, sizemin=7))
 
     # Установка индивидуальной прозрачности
     if opacity_map_user and group_for_plot and group_for_plot in plot_df.columns:
@@ -209,63 +205,20 @@ def plot_user_table(
             tr.marker.line.width = st_dict.get("outline_width", 1.0)
             # Не переопределяй marker.opacity тут!
 
+    # размер маркеров задаётся один раз (раньше sizeref=1/sizemin=7 сразу
+    # перезаписывались этими значениями)
     fig.update_traces(marker=dict(sizemode="diameter", sizeref=2.0, sizemin=2))
 
+    # оси и фон одним обновлением layout
     fig.update_layout(
-        xaxis_title=x_axis,
-        yaxis_title=y_axis,
+        xaxis=axis_layout(x_axis),
+        yaxis=axis_layout(y_axis),
         plot_bgcolor=bg_color,
         paper_bgcolor=bg_color,
         legend=dict(font=dict(color=font_color)),
         font=dict(color=font_color),
     )
 
-    axis_style = dict(
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-    fig.update_xaxes(
-        title_text=x_axis,
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-    fig.update_yaxes(
-        title_text=y_axis,
-        title_font=dict(size=18, color="#111111"),
-        tickfont=dict(size=14, color="#111111"),  # <--- ВАЖНО!
-        linecolor="#000000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000000",
-        gridcolor="rgba(0,0,0,0.15)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-    )
-
     return fig
 
 
@@ -283,14 +236,49 @@ def plot_box_plot(
     bg_color: str = "#ffffff",
     font_color: str = "#000000",
     hover_cols=None,
+):
+    fig = _build_box_plot(
+        df,
+        x,
+        y,
+        color=color,
+        color_map=color_map,
+        symbol_map=symbol_map,
+        size_map=size_map,
+        opacity_map=opacity_map,
+        outline_color_map=outline_color_map,
+        outline_width_map=outline_width_map,
+        bg_color=bg_color,
+        font_color=font_color,
+        hover_cols=hover_cols,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+    return fig
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def _build_box_plot(
+    df,
+    x: str,
+    y: str,
+    color: str | None = None,
+    color_map: dict | None = None,
+    symbol_map: dict | None = None,
+    size_map: dict | None = None,
+    opacity_map: dict | None = None,
+    outline_color_map: dict | None = None,
+    outline_width_map: dict | None = None,
+    bg_color: str = "#ffffff",
+    font_color: str = "#000000",
+    hover_cols=None,
 ):
     # --- 1. безопасный список колонок для tooltip ----------------
     hover_cols = hover_cols or []  # None → []
-    hover_dict = {c: True for c in hover_cols if c in df.columns}
-
     # скрывать служебный столбец только если он реально существует
-    if "__marker_size" in df.columns:
-        hover_dict["__marker_size"] = False
+    hover_dict = _hover_dict(
+        (c for c in hover_cols if c in df.columns),
+        ("__marker_size",) if "__marker_size" in df.columns else (),
+    )
 
     fig = px.box(
         df,
@@ -305,58 +293,53 @@ def plot_box_plot(
         hover_data=hover_dict,
     )
 
-    # 2️⃣ Перебор трэйсов и кастомизация точек по группам
-    for trace in fig.data:
-        group = trace.name
-        marker_args = {}
-        if symbol_map and group in symbol_map:
-            marker_args["symbol"] = symbol_map[group]
-        if size_map and group in size_map:
-            marker_args["size"] = size_map[group]
-        if opacity_map and group in opacity_map:
-            marker_args["opacity"] = opacity_map[group]
-        if outline_color_map and group in outline_color_map:
-            marker_args.setdefault("line", {})["color"] = outline_color_map[group]
-        if outline_width_map and group in outline_width_map:
-            marker_args.setdefault("line", {})["width"] = outline_width_map[group]
-        trace.update(
-            marker=marker_args,
+    # 2️⃣ Стили точек по группам собираются заранее, один проход по картам
+    styles_by_name = {}
+    for attr, style_map in (
+        ("symbol", symbol_map),
+        ("size", size_map),
+        ("opacity", opacity_map),
+    ):
+        for group, value in (style_map or {}).items():
+            styles_by_name.setdefault(group, {})[attr] = value
+    for attr, style_map in (
+        ("color", outline_color_map),
+        ("width", outline_width_map),
+    ):
+        for group, value in (style_map or {}).items():
+            styles_by_name.setdefault(group, {}).setdefault("line", {})[attr] = value
+
+    fig.for_each_trace(
+        lambda trace: trace.update(
+            marker=styles_by_name.get(trace.name, {}),
             jitter=0.3,
             pointpos=0,
             line=dict(width=1.5),
             whiskerwidth=0.4,
             width=0.4,
         )
-
-    # 3️⃣ оси, сетка, шрифты
-    axis_style = dict(
-        linecolor="#000",
-        mirror=True,
-        showline=True,
-        ticks="inside",
-        ticklen=6,
-        tickwidth=1,
-        tickcolor="#000",
-        gridcolor="rgba(0,0,0,0.12)",
-        minor_showgrid=True,
-        minor_gridwidth=0.5,
-        minor_gridcolor="rgba(0,0,0,0.05)",
-        title_font=dict(size=18, color=font_color),
-        tickfont=dict(size=14, color=font_color),
     )
-    fig.update_xaxes(**axis_style, tickangle=45)
-    fig.update_yaxes(**axis_style)
 
+    # 3️⃣ оси, сетка, шрифты — одним обновлением layout
+    title_font = dict(size=18, color=font_color)
+    tickfont = dict(size=14, color=font_color)
     fig.update_layout(
+        xaxis={
+            **_BOX_AXIS_STYLE,
+            "title": dict(text=x, font=title_font),
+            "tickfont": tickfont,
+            "tickangle": 45,
+        },
+        yaxis={
+            **_BOX_AXIS_STYLE,
+            "title": dict(text=y, font=title_font),
+            "tickfont": tickfont,
+        },
         boxmode="group",
         plot_bgcolor=bg_color,
         paper_bgcolor=bg_color,
         legend=dict(font=dict(size=14, color=font_color)),
         font=dict(color=font_color, size=16),
-        xaxis_title=x,
-        yaxis_title=y,
         margin=dict(l=80, r=60, t=40, b=100),
     )
-
-    st.plotly_chart(fig, use_container_width=True)
     return fig
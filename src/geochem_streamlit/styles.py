@@ -7,12 +7,14 @@ nothing is left unstyled.
 """
 
 from __future__ import annotations
-import colorsys
 import random
 from typing import Dict, Tuple
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from geochem_streamlit.utils import combine_labels
+
 # ----------------------------------------------------------------------
 # Pre‑defined styles for well‑known tectono‑magmatic types
 # ----------------------------------------------------------------------
@@ -46,6 +48,12 @@ AVAILABLE_SYMBOLS = [
     "octagon",
 ]
 
+# symbol -> position in AVAILABLE_SYMBOLS (selectbox index without list.index)
+SYMBOL_IDX: Dict[str, int] = {s: i for i, s in enumerate(AVAILABLE_SYMBOLS)}
+
+# Symbols already taken by TYPE_STYLES (never handed out to unknown types first)
+_KNOWN_SYMBOLS = frozenset(val["symbol"] for val in TYPE_STYLES.values())
+
 # ----------------------------------------------------------------------
 # Helper
 # ----------------------------------------------------------------------
@@ -53,7 +61,48 @@ AVAILABLE_SYMBOLS = [
 
 def _rgb_hex(r: float, g: float, b: float) -> str:
     """Convert 0‑1 floats to #RRGGBB."""
-    return f"#{int(r * 255):02x}{int(g * 255):02x}{int(b * 255):02x}"
+    return "#" + bytes((int(r * 255), int(g * 255), int(b * 255))).hex()
+
+
+def _rgb_to_hsv_np(
+    r: np.ndarray, g: np.ndarray, b: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorised ``colorsys.rgb_to_hsv`` (same formula, float64)."""
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    rangec = maxc - minc
+    grey = rangec == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(grey, 0.0, rangec / maxc)
+        rc = (maxc - r) / rangec
+        gc = (maxc - g) / rangec
+        bc = (maxc - b) / rangec
+    h = np.where(r == maxc, bc - gc, np.where(g == maxc, 2.0 + rc - bc, 4.0 + gc - rc))
+    h = np.where(grey, 0.0, (h / 6.0) % 1.0)
+    return h, s, maxc
+
+
+def _hsv_to_rgb_np(
+    h: np.ndarray, s: np.ndarray, v: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorised ``colorsys.hsv_to_rgb`` (same six-sector formula, float64)."""
+    i = (h * 6.0).astype(np.int64)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    sector = i % 6
+    r = np.choose(sector, [v, q, p, p, t, v])
+    g = np.choose(sector, [t, v, v, q, p, p])
+    b = np.choose(sector, [p, p, t, v, v, q])
+    return r, g, b
+
+
+def _rgb_hex_np(r: np.ndarray, g: np.ndarray, b: np.ndarray) -> list[str]:
+    """Convert arrays of 0‑1 floats to a list of #RRGGBB strings."""
+    rgb = (np.column_stack([r, g, b]) * 255).astype(np.uint8)
+    hex_str = rgb.tobytes().hex()
+    return ["#" + hex_str[k : k + 6] for k in range(0, len(hex_str), 6)]
 
 
 # ----------------------------------------------------------------------
@@ -73,47 +122,94 @@ def build_style_maps(
     * **symbol_map** maps every Type value     → marker symbol.
     * **size_map**   maps every Type value     → marker size in px.
     Unknown `type` values are assigned random symbol/colour, deterministic with seed 42.
+    Results are cached on the content of the two style columns only.
+    """
+    return _build_style_maps(df[[type_col, loc_col]], type_col, loc_col)
+
+
+def session_style_maps(
+    df: pd.DataFrame,
+    *,
+    type_col: str = "type",
+    loc_col: str = "Location",
+) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, int]]:
+    """Like :func:`build_style_maps`, but kept in ``st.session_state``.
+
+    The maps are rebuilt only when the two style columns change; otherwise
+    the same dicts are returned on every rerun (no cache lookup, no unpickle).
+    Treat them as read-only and copy before editing.
     """
+    row_hashes = pd.util.hash_pandas_object(df[[type_col, loc_col]], index=False)
+    key = (type_col, loc_col, hash(row_hashes.to_numpy().tobytes()))
+
+    cached = st.session_state.get("_style_maps")
+    if cached is None or cached[0] != key:
+        cached = (key, build_style_maps(df, type_col=type_col, loc_col=loc_col))
+        st.session_state["_style_maps"] = cached
+    return cached[1]
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def _build_style_maps(
+    df: pd.DataFrame, type_col: str, loc_col: str
+) -> Tuple[Dict[str, str], Dict[str, str], Dict[str, int]]:
     rng = random.Random(42)
 
     color_map: Dict[str, str] = {}
     symbol_map: Dict[str, str] = {}
     size_map: Dict[str, int] = {}
 
-    used_symbols = set(val["symbol"] for val in TYPE_STYLES.values())
+    # symbols still free for unknown types, in AVAILABLE_SYMBOLS order
+    unused_symbols = [s for s in AVAILABLE_SYMBOLS if s not in _KNOWN_SYMBOLS]
+    type_vals = sorted(df[type_col].dropna().unique())
+    base_colors: list[str] = []
 
-    # iterate over each type
-    for t_val, sub_df in df.groupby(type_col):
+    # iterate over each type (sorted, as groupby did)
+    for t_val in type_vals:
         t_key = str(t_val)
 
         if t_key in TYPE_STYLES:  # known style
             style = TYPE_STYLES[t_key]
         else:  # generate new random style
             # unique random symbol
-            sym_choices = [s for s in AVAILABLE_SYMBOLS if s not in used_symbols]
-            if not sym_choices:
-                sym_choices = AVAILABLE_SYMBOLS  # fallback allow repeats
-            symbol = rng.choice(sym_choices)
-            used_symbols.add(symbol)
+            if unused_symbols:
+                # pop by random index: same draw as rng.choice, no remove() scan
+                symbol = unused_symbols.pop(rng.randrange(len(unused_symbols)))
+            else:
+                symbol = rng.choice(AVAILABLE_SYMBOLS)  # fallback allow repeats
             # random colour
             base_color = _rgb_hex(rng.random(), rng.random(), rng.random())
             style = {"symbol": symbol, "base_color": base_color, "size": 10}
 
         symbol_map[t_key] = style["symbol"]
         size_map[t_key] = int(style["size"])
+        base_colors.append(style["base_color"].lstrip("#"))
 
-        # convert base colour to HSV for lightness variation
-        base_hex = style["base_color"].lstrip("#")
-        br, bg, bb = (int(base_hex[i : i + 2], 16) / 255 for i in (0, 2, 4))
-        h, s, _ = colorsys.rgb_to_hsv(br, bg, bb)
+    # base colours -> HSV in one pass; hue/saturation per type drive the ramp
+    base_rgb = np.frombuffer(bytes.fromhex("".join(base_colors)), dtype=np.uint8)
+    base_rgb = base_rgb.reshape(-1, 3) / 255
+    hue, sat, _ = _rgb_to_hsv_np(base_rgb[:, 0], base_rgb[:, 1], base_rgb[:, 2])
 
-        loc_values = sorted(sub_df[loc_col].dropna().unique())
-        n = max(1, len(loc_values) - 1)
-        for i, loc in enumerate(loc_values):
-            v = 0.6 + 0.4 * (i / n)  # brightness 60‑100 %
-            r, g, b = colorsys.hsv_to_rgb(h, s, v)
-            type_loc_key = f"{t_key}|{loc}"  # t_key = текущий type
-            color_map[type_loc_key] = _rgb_hex(r, g, b)
+    # every (type, Location) pair at once: rank of the location inside its
+    # type (dense, sorted) gives the brightness, no per-type sub-frames
+    pairs = (
+        df[[type_col, loc_col]]
+        .dropna()
+        .drop_duplicates()
+        .sort_values([type_col, loc_col], kind="stable")
+    )
+    by_type = pairs.groupby(type_col, sort=False, observed=True)
+    rank = by_type.cumcount().to_numpy()
+    n = np.maximum(by_type[loc_col].transform("size").to_numpy() - 1, 1)
+    brightness = 0.6 + 0.4 * (rank / n)  # brightness 60‑100 %
+
+    # one vectorised HSV -> RGB -> hex pass over all pairs; hue/saturation
+    # are gathered per pair from the per-type arrays by position
+    type_pos = pd.Index(type_vals).get_indexer(pairs[type_col])
+    pair_colors = _rgb_hex_np(*_hsv_to_rgb_np(hue[type_pos], sat[type_pos], brightness))
+    # "type|Location" keys for all pairs at once (same labels as type_loc)
+    pair_keys = combine_labels(pairs[type_col], pairs[loc_col])
+    color_map.update(zip(pair_keys, pair_colors))
 
     # ensure every location has a colour (edge case if groupby filtered)
     for loc in df[loc_col].dropna().unique():
@@ -124,6 +220,23 @@ def build_style_maps(
     return color_map, symbol_map, size_map
 
 
+def line_style_defaults(color_map: Dict[str, str]) -> Tuple[dict, ...]:
+    """Return default (opacity, width, dash, line_color, outline_color,
+    outline_width) maps for the groups of *color_map*.
+
+    Every map shares the key set of *color_map*; ``dict.fromkeys`` fills each
+    one in C instead of a Python comprehension per attribute.
+    """
+    return (
+        dict.fromkeys(color_map, 0.9),
+        dict.fromkeys(color_map, 2),
+        dict.fromkeys(color_map, "solid"),
+        color_map.copy(),  # line colour starts as the marker colour
+        dict.fromkeys(color_map, "#000000"),  # black outline
+        dict.fromkeys(color_map, 0),
+    )
+
+
 def line_style_editor(
     groups,
     color_map,
@@ -135,51 +248,61 @@ def line_style_editor(
     line_color_map,
     outline_color_map,
     outline_width_map,
+    form_key="line_style_form",
 ):
-    for g in groups:
-        with st.sidebar.expander(g, expanded=False):
-            color_map[g] = st.color_picker(
-                "Marker color", color_map[g], key=f"{g}_col_me"
-            )
-
-            symbol_map[g] = st.selectbox(
-                "Symbol",
-                AVAILABLE_SYMBOLS,
-                index=AVAILABLE_SYMBOLS.index(symbol_map[g]),
-                key=f"{g}_sym_me",
-            )
-
-            size_map[g] = st.slider(
-                "Marker size", 4, 20, size_map[g], key=f"{g}_size_me"
-            )
-
-            line_color_map[g] = st.color_picker(
-                "Line color", line_color_map[g], key=f"{g}_linecol_me"
-            )
-
-            outline_color_map[g] = st.color_picker(  # NEW
-                "Outline color", outline_color_map[g], key=f"{g}_outcol_me"
-            )
-
-            outline_width_map[g] = st.slider(
-                "Outline width", 0, 5, outline_width_map[g], key=f"{g}_outwid_me"
-            )
-
-            opacity_map[g] = (
-                st.slider(
-                    "Opacity (%)", 10, 100, int(opacity_map[g] * 100), key=f"{g}_op_me"
+    # Форма: изменения виджетов не перезапускают скрипт до нажатия «Apply»
+    with st.sidebar.form(key=form_key):
+        for g in groups:
+            with st.expander(g, expanded=False):
+                color_map[g] = st.color_picker(
+                    "Marker color", color_map[g], key=f"{g}_col_me"
+                )
+
+                symbol_map[g] = st.selectbox(
+                    "Symbol",
+                    AVAILABLE_SYMBOLS,
+                    index=SYMBOL_IDX.get(symbol_map[g], 0),
+                    key=f"{g}_sym_me",
+                )
+
+                size_map[g] = st.slider(
+                    "Marker size", 4, 20, size_map[g], key=f"{g}_size_me"
+                )
+
+                line_color_map[g] = st.color_picker(
+                    "Line color", line_color_map[g], key=f"{g}_linecol_me"
                 )
-                / 100
-            )
 
-            width_map[g] = st.slider("Line width", 1, 6, width_map[g], key=f"{g}_lw_me")
+                outline_color_map[g] = st.color_picker(  # NEW
+                    "Outline color", outline_color_map[g], key=f"{g}_outcol_me"
+                )
+
+                outline_width_map[g] = st.slider(
+                    "Outline width", 0, 5, outline_width_map[g], key=f"{g}_outwid_me"
+                )
 
-            dash_map[g] = st.selectbox(
-                "Dash",
-                ["solid", "dash", "dot", "dashdot"],
-                index=["solid", "dash", "dot", "dashdot"].index(dash_map[g]),
-                key=f"{g}_dash_me",
-            )
+                opacity_map[g] = (
+                    st.slider(
+                        "Opacity (%)",
+                        10,
+                        100,
+                        int(opacity_map[g] * 100),
+                        key=f"{g}_op_me",
+                    )
+                    / 100
+                )
+
+                width_map[g] = st.slider(
+                    "Line width", 1, 6, width_map[g], key=f"{g}_lw_me"
+                )
+
+                dash_map[g] = st.selectbox(
+                    "Dash",
+                    ["solid", "dash", "dot", "dashdot"],
+                    index=["solid", "dash", "dot", "dashdot"].index(dash_map[g]),
+                    key=f"{g}_dash_me",
+                )
+        st.form_submit_button("Apply", use_container_width=True)
     return (
         color_map,
         symbol_map,
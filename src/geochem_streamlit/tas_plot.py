@@ -2,37 +2,21 @@ import plotly.graph_objects as go
 import streamlit as st
 import pandas as pd
 
-AXIS_STYLE = dict(
-    linecolor="#000000",
-    mirror=True,
-    showline=True,
-    ticks="inside",
-    ticklen=6,
-    tickwidth=1,
-    tickcolor="#000000",
-    gridcolor="rgba(0,0,0,0.15)",
-    minor_showgrid=True,
-    minor_gridwidth=0.5,
-    minor_gridcolor="rgba(0,0,0,0.05)",
-    title_font=dict(size=18, color="#111111"),
-    tickfont=dict(size=14, color="#111111"),
-)
+from geochem_streamlit.axis_style import axis_layout
 
+# Одна подпись на поле (координаты — центр поля в SiO₂ / Na₂O + K₂O)
 FIELD_LABELS = {
     "Picro-basalt": (42.5, 2),
     "Basalt": (47, 4.0),
-    "Basaltic andesite": (49, 6.2),
-    "Andesite": (53, 8.3),
-    "Dacite": (57, 8.0),
+    "Basaltic andesite": (54, 4.0),
+    "Andesite": (60, 4.0),
+    "Dacite": (68, 4.0),
     "Rhyolite": (72, 8.0),
     "Basanite": (43, 7.0),
     "Phonotephrite": (48, 9.0),
     "Tephriphonolite": (53, 12.0),
     "Phonolite": (57.5, 13.0),
     "Trachyte": (65, 11.0),
-    "Basaltic andesite": (54, 4.0),
-    "Andesite": (60, 4.0),
-    "Dacite": (68, 4.0),
     "Trachybasalt": (49, 6.0),
     "Basaltic trachy-andesite": (53, 7.0),
     "Trachy-andesite": (58, 9.0),
@@ -44,8 +28,10 @@ def add_field_labels(
     fig, labels=FIELD_LABELS, font_size=12, font_color="#000000", opacity=0.9
 ):
     """Кладёт подписи TAS-полей по фиксированным координатам."""
-    for name, (x, y) in labels.items():
-        fig.add_annotation(
+    # все подписи одним обновлением layout (add_annotation в цикле каждый раз
+    # пересобирает и проверяет весь кортеж annotations)
+    annotations = [
+        dict(
             x=x,
             y=y,
             text=name,
@@ -55,15 +41,21 @@ def add_field_labels(
             align="center",
             hovertext=name,
         )
+        for name, (x, y) in labels.items()
+    ]
+    fig.update_layout(annotations=[*fig.layout.annotations, *annotations])
 
 
+# Шаблон TAS не зависит от данных: строится один раз, при rerun из кэша
+# возвращается готовая копия (её можно дополнять трэйсами, кэш не меняется)
+@st.cache_data(show_spinner=False)
 def empty_tas_figure():
     fig = go.Figure()
 
     # ── оси и диапазоны ─────────────────────────────────────────
     fig.update_layout(
-        xaxis=dict(title="SiO₂ (wt %)", range=[35, 80], **AXIS_STYLE),
-        yaxis=dict(title="Na₂O + K₂O (wt %)", range=[0, 15], **AXIS_STYLE),
+        xaxis=axis_layout("SiO₂ (wt %)", range=[35, 80]),
+        yaxis=axis_layout("Na₂O + K₂O (wt %)", range=[0, 15]),
         height=800,
         width=700,
         paper_bgcolor="#ffffff",
@@ -101,17 +93,21 @@ def empty_tas_figure():
         ([69, 77.5], [8.0, 0.5]),
         ([57.6, 61], [11.7, 13.5]),
     ]
+    # все границы одним трэйсом: сегменты разделены None (разрыв линии)
+    xs, ys = [], []
     for x, y in segments:
-        fig.add_trace(
-            go.Scatter(
-                x=x,
-                y=y,
-                mode="lines",
-                line=dict(color="black", width=0.5),
-                hoverinfo="skip",
-                showlegend=False,
-            )
+        xs += x + [None]
+        ys += y + [None]
+    fig.add_trace(
+        go.Scatter(
+            x=xs,
+            y=ys,
+            mode="lines",
+            line=dict(color="black", width=0.5),
+            hoverinfo="skip",
+            showlegend=False,
         )
+    )
 
     add_field_labels(fig)
     return fig
@@ -136,19 +132,28 @@ def plot_tas_diagram(
     # 1) если base_fig задан → берём его, иначе создаём de-novo
     fig = base_fig if base_fig is not None else empty_tas_figure()
 
-    # 2) далее только добавляем точки
+    # 2) далее только добавляем точки; на больших выборках — WebGL, как
+    #    render_mode="auto" в plotly.express (экспорт сам переводит *gl в SVG)
+    scatter = go.Scattergl if len(df) > 1000 else go.Scatter
     if group_col and group_col in df.columns:
-        for group, sdf in df.groupby(group_col):
+        # коды групп вместо groupby: группы в том же порядке (сортировка,
+        # NaN пропускается), точки каждой группы — по маске над массивами
+        codes, groups = pd.factorize(df[group_col], sort=True)
+        x_vals = df[x_col].to_numpy()
+        y_vals = df[y_col].to_numpy()
+        color_map_user = color_map_user or {}
+        symbol_map_user = symbol_map_user or {}
+        size_map_user = size_map_user or {}
+        styles = styles or {}
+
+        traces = []
+        for code, group in enumerate(groups):
             marker = dict(
-                size=size_map_user.get(group, 10) if size_map_user else 10,
-                color=color_map_user.get(group, "#1f77b4")
-                if color_map_user
-                else "#1f77b4",
-                symbol=symbol_map_user.get(group, "circle")
-                if symbol_map_user
-                else "circle",
+                size=size_map_user.get(group, 10),
+                color=color_map_user.get(group, "#1f77b4"),
+                symbol=symbol_map_user.get(group, "circle"),
             )
-            if styles and group in styles:
+            if group in styles:
                 stl = styles[group]
                 marker.update(
                     line=dict(
@@ -157,19 +162,21 @@ def plot_tas_diagram(
                     ),
                     opacity=stl.get("opacity", 0.9),
                 )
-            fig.add_trace(
-                go.Scatter(
-                    x=sdf[x_col],
-                    y=sdf[y_col],
+            in_group = codes == code
+            traces.append(
+                scatter(
+                    x=x_vals[in_group],
+                    y=y_vals[in_group],
                     mode="markers",
                     name=str(group),
                     showlegend=True,
                     marker=marker,
                 )
             )
+        fig.add_traces(traces)
     else:
         fig.add_trace(
-            go.Scatter(
+            scatter(
                 x=df[x_col],
                 y=df[y_col],
                 mode="markers",
@@ -191,6 +198,14 @@ def plot_tas_diagram(
     return fig
 
 
+# Сумма щелочей зависит только от двух столбцов: кэш по их содержимому,
+# разбор текстовых значений (to_numeric) не повторяется при каждом rerun
+@st.cache_data(show_spinner=False, max_entries=8)
+def _total_alkali(oxides):
+    na, k = oxides.iloc[:, 0], oxides.iloc[:, 1]
+    return pd.to_numeric(na, errors="coerce") + pd.to_numeric(k, errors="coerce")
+
+
 def show_tas(
     df,
     user_data,
@@ -231,7 +246,7 @@ def show_tas(
         color_map_user, symbol_map_user, size_map_user = build_group_style(
             df, group_for_plot, base_color, base_symbol, base_size
         )
-        opacity_map_user = {g: 0.9 for g in color_map_user}
+        opacity_map_user = dict.fromkeys(color_map_user, 0.9)
 
         st.sidebar.markdown(f"---\n### Color & Trace style ({group_for_plot})")
         color_map_user, symbol_map_user, size_map_user, opacity_map_user = (
@@ -247,7 +262,7 @@ def show_tas(
         color_map_user = base_color.copy()
         symbol_map_user = base_symbol.copy()
         size_map_user = base_size.copy()
-        opacity_map_user = {g: 0.9 for g in color_map_user}
+        opacity_map_user = dict.fromkeys(color_map_user, 0.9)
 
     styles = {
         g: {
@@ -259,15 +274,13 @@ def show_tas(
         for g in color_map_user
     }
 
-    # 4. подготовка данных
-    df = df.copy()
-    df["Na2O+K2O"] = pd.to_numeric(df[na_col], errors="coerce") + pd.to_numeric(
-        df[k_col], errors="coerce"
-    )
+    # 4. подготовка данных: поверхностная копия — столбцы общие с исходной
+    #    таблицей, добавляется только сумма щелочей
+    df = df.copy(deep=False)
+    df["Na2O+K2O"] = _total_alkali(df[[na_col, k_col]])
     df = filter_dataframe(df, "TAS diagram")
 
     # 5. график
-    base = empty_tas_figure()
     fig = plot_tas_diagram(
         df,
         x_col=si_col,
@@ -279,6 +292,6 @@ def show_tas(
         styles=styles,
     )
     st.plotly_chart(fig, use_container_width=True, key="tas_diagram_chart")
-    
+
     # ВМЕСТО st.stop() возвращаем fig и plot_df для экспорта
     return fig, df  # Возвращаем для экспорта
@@ -1,5 +1,9 @@
+import functools
+import hashlib
 import random
-import plotly.express as px
+import re
+
+import pandas as pd
 import streamlit as st
 
 
@@ -24,60 +28,111 @@ def get_available_symbols():
     ]
 
 
+# Цвет в таблице стилей — строка вида #RRGGBB
+_HEX_COLOR = re.compile(r"#[0-9a-fA-F]{6}")
+
+
 def generate_group_styles(groups):
-    random.seed(42)  # чтобы цвета были всегда одинаковы для одной и той же группы
-    colors = []
-    for _ in groups:
-        color = "#" + "".join([random.choice("0123456789ABCDEF") for _ in range(6)])
-        colors.append(color)
-    symbols = random.sample(
-        get_available_symbols(), min(len(groups), len(get_available_symbols()))
-    )
+    # результат зависит только от набора групп — кэш по кортежу;
+    # копии, т.к. редакторы стилей правят словари на месте
+    color_map, symbol_map = _generate_group_styles(tuple(groups))
+    return dict(color_map), dict(symbol_map)
+
+
+@functools.lru_cache(maxsize=128)
+def _generate_group_styles(groups):
+    # свой генератор с seed 42: цвета всегда одинаковы для одной и той же
+    # группы, глобальное состояние random не сбрасывается
+    rng = random.Random(42)
+    # все шестнадцатеричные цифры одним списком (та же последовательность,
+    # что и при поштучном выборе), затем нарезка по 6 на группу
+    digits = "".join([rng.choice("0123456789ABCDEF") for _ in range(6 * len(groups))])
+    colors = ["#" + digits[i : i + 6] for i in range(0, len(digits), 6)]
+    available = get_available_symbols()
+    symbols = rng.sample(available, min(len(groups), len(available)))
     # Если групп больше, чем символов, повторяем символы
     while len(symbols) < len(groups):
-        symbols += random.sample(
-            get_available_symbols(),
-            min(len(groups) - len(symbols), len(get_available_symbols())),
+        symbols += rng.sample(
+            available, min(len(groups) - len(symbols), len(available))
         )
     color_map = dict(zip(groups, colors))
     symbol_map = dict(zip(groups, symbols))
     return color_map, symbol_map
 
 
-def group_style_editor(groups, color_map, symbol_map, size_map=None, opacity_map=None):
+def group_style_editor(
+    groups,
+    color_map,
+    symbol_map,
+    size_map=None,
+    opacity_map=None,
+    form_key="group_style_form",
+):
     available_symbols = get_available_symbols()
     if size_map is None:
         size_map = {g: 20 for g in groups}
     if opacity_map is None:
         opacity_map = {g: 0.9 for g in groups}
-    for group in groups:
-        with st.sidebar.expander(str(group), expanded=False):
-            cur_color = color_map[group]
-            cur_symbol = symbol_map[group]
-            cur_size = size_map.get(group, 20)
-            cur_opacity = opacity_map.get(group, 0.9)
-            color = st.color_picker("Color", cur_color, key=f"user_color_{group}")
-            sym_idx = (
-                available_symbols.index(cur_symbol)
-                if cur_symbol in available_symbols
-                else 0
-            )
-            symbol = st.selectbox(
-                "Symbol", available_symbols, index=sym_idx, key=f"user_symbol_{group}"
-            )
-            size = st.slider("Size (px)", 5, 40, cur_size, key=f"user_size_{group}")
-            opacity = (
-                st.slider(
-                    "Opacity (%)",
-                    10,
-                    100,
-                    int(cur_opacity * 100),
-                    key=f"user_opacity_{group}",
-                )
-                / 100
-            )
+    # Одна таблица вместо четырёх виджетов на группу — один элемент
+    # интерфейса при любом числе групп
+    # строки индексируются подписью группы, а набор групп входит в ключ
+    # виджета: сохранённые правки относятся к группе, а не к номеру строки,
+    # и не переезжают на другие группы при смене группировки или фильтра
+    labels = [str(g) for g in groups]
+    group_by_label = dict(zip(labels, groups))
+    style_df = pd.DataFrame(
+        {
+            "color": [color_map[g] for g in groups],
+            "symbol": [symbol_map[g] for g in groups],
+            "size": [size_map.get(g, 20) for g in groups],
+            "opacity": [int(opacity_map.get(g, 0.9) * 100) for g in groups],
+        },
+        index=pd.Index(labels, name="group"),
+    )
+    groups_sig = hashlib.blake2b(
+        "\x1f".join(labels).encode(), digest_size=8
+    ).hexdigest()
+    # Форма: правки таблицы не перезапускают скрипт до нажатия «Apply»
+    with st.sidebar.form(key=form_key):
+        edited = st.data_editor(
+            style_df,
+            column_config={
+                "_index": st.column_config.TextColumn("Group"),
+                "color": st.column_config.TextColumn(
+                    "Color", validate=_HEX_COLOR.pattern
+                ),
+                "symbol": st.column_config.SelectboxColumn(
+                    "Symbol", options=available_symbols, required=True
+                ),
+                "size": st.column_config.NumberColumn(
+                    "Size (px)", min_value=5, max_value=40, step=1
+                ),
+                "opacity": st.column_config.NumberColumn(
+                    "Opacity (%)", min_value=10, max_value=100, step=1
+                ),
+            },
+            num_rows="fixed",
+            use_container_width=True,
+            key=f"{form_key}_table_{groups_sig}",
+        )
+        st.form_submit_button("Apply", use_container_width=True)
+
+    # правки возвращаются по подписи группы; пустые или некорректные ячейки
+    # оставляют прежнее значение
+    for label, color, symbol, size, opacity in zip(
+        edited.index,
+        edited["color"],
+        edited["symbol"],
+        edited["size"],
+        edited["opacity"],
+    ):
+        group = group_by_label[label]
+        if isinstance(color, str) and _HEX_COLOR.fullmatch(color):
             color_map[group] = color
+        if symbol in available_symbols:
             symbol_map[group] = symbol
-            size_map[group] = size
-            opacity_map[group] = opacity
+        if pd.notna(size):
+            size_map[group] = int(size)
+        if pd.notna(opacity):
+            opacity_map[group] = int(opacity) / 100
     return color_map, symbol_map, size_map, opacity_map
@@ -1,7 +1,40 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
 
 
+def _str_codes(s: pd.Series):
+    """Коды pd.factorize и строковые подписи уникальных значений (как astype(str))."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # категории (например, бины из binning_widget): коды уже готовы,
+        # пропуску (-1) отводится последний код с подписью "nan"
+        labels = pd.Series(s.cat.categories).astype(str).to_numpy()
+        codes = s.cat.codes.to_numpy()
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(labels), codes)
+            labels = np.append(labels, "nan")
+        return codes, labels
+    if s.dtype == object:
+        # None/NaN и 1/True в object-столбце factorize склеивает, astype(str) — нет
+        s = s.astype(str)
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    return codes, pd.Series(uniques, dtype=s.dtype).astype(str).to_numpy()
+
+
+def combine_labels(left: pd.Series, right: pd.Series, sep: str = "|") -> pd.Series:
+    """То же, что left.astype(str) + sep + right.astype(str), но строки
+    собираются один раз на уникальную пару, а не на каждую строку таблицы."""
+    l_codes, l_values = _str_codes(left)
+    r_codes, r_values = _str_codes(right)
+    n_right = max(len(r_values), 1)
+    pair_codes, pairs = pd.factorize(l_codes * n_right + r_codes)
+    labels = np.array(
+        [f"{l_values[p // n_right]}{sep}{r_values[p % n_right]}" for p in pairs],
+        dtype=object,
+    )
+    return pd.Series(labels.take(pair_codes), index=left.index, dtype=object)
+
+
 def axis_selector(df: pd.DataFrame, label: str, default: str) -> str:
     mode_key, col_key = f"{label}_mode", f"{label}_col"
     st.session_state.setdefault(mode_key, "Column")